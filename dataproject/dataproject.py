@@ -1,5 +1,245 @@
-def plot_e(df, country): 
+import os
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+def plot_e(df, country):
     I = df['country'] == country
     ax=df.loc[I,:].plot(x='year', y='rec_demean', style='-o', legend=False)
     ax=df.loc[I,:].plot(x='year', y='gdp_demean', style='-o', legend=False)
-    
+
+def panel_transform(df, columns=('rec','gdp'), logs=True):
+    """ per-country means, differences to the mean and logs of the indicators in columns
+
+    df has a row per country and year, e.g. from PanelCache.load or wb_rec and wb_gdp merged on
+    ['country','year']. All indicators are transformed at once on the same rows, so no merges are needed.
+    """
+
+    columns = list(columns)
+    df = df.sort_values(['country','year']).reset_index(drop=True)
+
+    # split-apply-combine in one pass for all indicators
+    means = df.groupby('country', observed=True, sort=False)[columns].transform('mean')
+    for col in columns:
+        df[f'{col}_mean'] = means[col]
+        df[f'{col}_demean'] = df[col] - means[col]
+
+    # logs are only defined for positive values, the rest are NaN
+    if logs:
+        for col in columns:
+            values = df[col].values
+            df[f'log_{col}'] = np.log(values, out=np.full(values.shape, np.nan), where=values > 0)
+
+    return df
+
+# World Bank indicators used in the project and the names of their columns
+INDICATORS = {'EG.FEC.RNEW.ZS':'rec', 'NY.GDP.PCAP.KD.ZG':'gdp'}
+
+# the csv files downloaded in the notebook and the countries in them
+FIXTURE_FILES = {'EG.FEC.RNEW.ZS':'Renewable_energy_consumption.csv', 'NY.GDP.PCAP.KD.ZG':'GDP_per_capita_growth.csv'}
+FIXTURE_COUNTRIES = {'DE':'Germany', 'DK':'Denmark', 'IT':'Italy', 'LT':'Lithuania'}
+
+def local_wb(indicator, country, start, end):
+    """ stands in for wb.download with the csv files in the project folder """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    df = pd.read_csv(os.path.join(folder, FIXTURE_FILES[indicator]))
+    df = df.rename(columns={INDICATORS[indicator]:indicator})
+
+    # same countries and years as requested and the same index as wb.download
+    names = [FIXTURE_COUNTRIES[code] for code in country if code in FIXTURE_COUNTRIES]
+    I = df['country'].isin(names) & (df['year'] >= start) & (df['year'] <= end)
+    df = df.loc[I,:]
+    df['year'] = df['year'].astype(str)
+
+    return df.set_index(['country','year'])
+
+class PanelCache:
+
+    def __init__(self, folder='wb_cache', download=None, names=None):
+        """ World Bank panel stored on disk as one .npz file per indicator
+
+        Each file holds the country codes and names, the years, a (country, year) matrix of values
+        and a matrix of which (country, year) slices have been downloaded, so only the missing
+        slices are downloaded when the countries or years change.
+
+        folder: where the .npz files are kept
+        download: function with the signature of wb.download, pandas_datareader.wb.download if None
+        names: dict from country codes to the names used by download, from wb.get_countries if None
+        """
+
+        self.folder = folder
+        self.download = download
+        self.names = names
+        self.downloads = 0
+
+    def path(self, indicator):
+        return os.path.join(self.folder, f'{indicator}.npz')
+
+    def country_names(self, codes):
+        if self.names is None:
+            from pandas_datareader import wb
+            countries = wb.get_countries()
+            self.names = dict(zip(countries['iso2c'], countries['name']))
+        return np.array([self.names[code] for code in codes], dtype='U64')
+
+    def read(self, indicator):
+        """ arrays in the cache of an indicator, empty if there is none """
+
+        if not os.path.exists(self.path(indicator)):
+            return {'codes':np.array([], dtype='U3'), 'names':np.array([], dtype='U64'), 'years':np.array([], dtype=int),
+                    'values':np.empty((0,0)), 'have':np.empty((0,0), dtype=bool)}
+
+        with np.load(self.path(indicator)) as data:
+            return {key:data[key] for key in data.files}
+
+    def write(self, indicator, cache):
+        os.makedirs(self.folder, exist_ok=True)
+        np.savez(self.path(indicator), **cache)
+
+    def refresh(self, indicator, countries, start, end):
+        """ download the (country, year) slices of an indicator that are not in the cache """
+
+        cache = self.read(indicator)
+        years = np.arange(start, end+1)
+
+        # a. add the new countries and years as missing
+        new_codes = np.setdiff1d(countries, cache['codes'])
+        new_years = np.setdiff1d(years, cache['years'])
+        if new_codes.size > 0 or new_years.size > 0:
+            codes = np.concatenate([cache['codes'], new_codes])
+            all_years = np.union1d(cache['years'], new_years)
+            values = np.full((codes.size, all_years.size), np.nan)
+            have = np.zeros((codes.size, all_years.size), dtype=bool)
+            J = np.searchsorted(all_years, cache['years'])
+            values[:cache['codes'].size, J] = cache['values']
+            have[:cache['codes'].size, J] = cache['have']
+            names = np.concatenate([cache['names'], self.country_names(new_codes)])
+            cache = {'codes':codes, 'names':names, 'years':all_years, 'values':values, 'have':have}
+
+        # b. missing slices
+        I = np.searchsorted(cache['codes'], countries, sorter=np.argsort(cache['codes']))
+        I = np.argsort(cache['codes'])[I]
+        J = np.searchsorted(cache['years'], years)
+        missing = ~cache['have'][np.ix_(I,J)]
+        if not missing.any():
+            return cache
+
+        # c. countries with the same missing years are downloaded together, one request per run of consecutive missing years
+        download = self.download
+        if download is None:
+            from pandas_datareader import wb
+            download = wb.download
+
+        row_of_name = dict(zip(cache['names'], range(cache['codes'].size)))
+        rows_missing = missing.any(axis=1)
+        missing_countries = np.asarray(countries)[rows_missing]
+        missing_rows = I[rows_missing]
+        patterns, group = np.unique(missing[rows_missing], axis=0, return_inverse=True)
+        group = np.ravel(group)
+        for g, pattern in enumerate(patterns):
+            group_countries = missing_countries[group == g]
+            group_rows = missing_rows[group == g]
+            run_starts = np.flatnonzero(pattern & ~np.r_[False, pattern[:-1]])
+            run_ends = np.flatnonzero(pattern & ~np.r_[pattern[1:], False])
+            for j0, j1 in zip(run_starts, run_ends):
+                df = download(indicator=indicator, country=group_countries.tolist(), start=int(years[j0]), end=int(years[j1]))
+                self.downloads += 1
+
+                # d. fill in
+                df = df.reset_index()
+                df['year'] = df['year'].astype(int)
+                r = df['country'].map(row_of_name).values
+                c = np.searchsorted(cache['years'], df['year'].values)
+                cache['values'][r, c] = df[indicator].values
+                cache['have'][np.ix_(group_rows, J[j0:j1+1])] = True
+
+        self.write(indicator, cache)
+
+        return cache
+
+    def load(self, indicators=tuple(INDICATORS), countries=tuple(FIXTURE_COUNTRIES), start=2000, end=2019):
+        """ panel with a row per country and year and a column per indicator
+
+        the country column is categorical, the rows are sorted by country and year
+        """
+
+        countries = np.asarray(countries)
+        years = np.arange(start, end+1)
+
+        panel = {}
+        for indicator in indicators:
+            cache = self.refresh(indicator, countries, start, end)
+            order = np.argsort(cache['codes'])
+            I = order[np.searchsorted(cache['codes'], countries, sorter=order)]
+            J = np.searchsorted(cache['years'], years)
+            panel[INDICATORS.get(indicator, indicator)] = cache['values'][np.ix_(I,J)]
+            names = cache['names'][I]
+
+        # sort by country name as in wb.download
+        order = np.argsort(names, kind='stable')
+        categories = names[order]
+        df = pd.DataFrame({'country':pd.Categorical.from_codes(np.repeat(np.arange(countries.size), years.size), categories),
+                           'year':np.tile(years, countries.size)})
+        for name, values in panel.items():
+            df[name] = values[order].ravel()
+
+        return df
+
+class PanelView:
+
+    def __init__(self, df, columns=('rec_demean','gdp_demean')):
+        """ per-country view of a panel for plot_e
+
+        The rows are sorted by country once and each country gets the slice of its rows, so
+        switching country does not scan the panel. The figure is made once and only the data
+        of its lines are updated.
+        """
+
+        df = df.sort_values(['country','year'])
+        self.columns = list(columns)
+        self.year = df['year'].values
+        self.values = df[self.columns].values
+
+        # a. country -> slice of its rows
+        country = df['country'].astype(str).values
+        starts = np.flatnonzero(np.r_[True, country[1:] != country[:-1]])
+        ends = np.r_[starts[1:], country.size]
+        self.index = {country[start]:slice(start, end) for start, end in zip(starts, ends)}
+        self.countries = list(self.index)
+
+        # b. arrays of the countries that have been shown
+        self.cache = {}
+
+        self.fig = None
+
+    def arrays(self, country):
+        """ years and values of a country """
+
+        if country not in self.cache:
+            rows = self.index[country]
+            self.cache[country] = (self.year[rows], self.values[rows])
+        return self.cache[country]
+
+    def plot_e(self, country):
+        """ same plots as plot_e, in one figure that is reused when the country changes """
+
+        year, values = self.arrays(country)
+
+        if self.fig is None:
+            self.fig, axes = plt.subplots(1, len(self.columns), figsize=(6*len(self.columns), 4))
+            self.axes = np.atleast_1d(axes)
+            self.lines = [ax.plot(year, values[:,j], '-o')[0] for j, ax in enumerate(self.axes)]
+            for ax, col in zip(self.axes, self.columns):
+                ax.set_xlabel('year')
+                ax.set_ylabel(col)
+        else:
+            for j, (ax, line) in enumerate(zip(self.axes, self.lines)):
+                line.set_data(year, values[:,j])
+                ax.relim()
+                ax.autoscale_view()
+
+        self.fig.suptitle(country)
+        self.fig.canvas.draw_idle()
+
+        return self.fig
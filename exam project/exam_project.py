@@ -1,10 +1,220 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import optimize
 from scipy.optimize import minimize
 
-class ExAnteValueCalculator:
-    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K):
+def make_rng(rng):
+    # None keeps using the global np.random state, a seed or SeedSequence gives a new Generator
+    if rng is None or isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def draw_shocks(sigma_epsilon, K, T, rng=None):
+    # all K shock series at once, same draws as K successive calls of size T
+    if rng is None:
+        return np.random.uniform(-0.5 * sigma_epsilon ** 2, sigma_epsilon, (K, T))
+    return rng.uniform(-0.5 * sigma_epsilon ** 2, sigma_epsilon, (K, T))
+
+
+def simulate_chunk(eta, iota, R, policy, sigma_epsilon, K, T, seed, batch_size):
+    # one chunk of a parallel run with its own random stream, drawn in batches of series
+    rng = np.random.default_rng(seed)
+    simulator = PolicySimulator(eta, iota, R)
+    ex_post_values = np.empty(K)
+
+    for i in range(0, K, batch_size):
+        n = min(batch_size, K - i)
+        ex_post_values[i:i + n] = simulator.simulate(policy, draw_shocks(sigma_epsilon, n, T, rng))
+
+    return ex_post_values
+
+
+class Policy:
+    # hire ell* at the fixed wage w and pay the adjustment cost every period
+    def __init__(self, w=1.0):
+        self.w = w
+
+    def wage(self, prev_profit, out=None):
+        return self.w
+
+    def adjust(self, ell_prev, ell_ast, out=None):
+        if out is None:
+            return np.ones(ell_ast.shape, dtype=bool)
+        out[:] = True
+        return out
+
+
+class DeltaPolicy(Policy):
+    # pay the adjustment cost only when ell* is more than Delta away from last period
+    def __init__(self, w, Delta):
+        self.w = w
+        self.Delta = Delta
+
+    def adjust(self, ell_prev, ell_ast, out=None):
+        return np.greater(np.abs(ell_prev - ell_ast), self.Delta, out=out)
+
+
+class ProfitWagePolicy(DeltaPolicy):
+    # the wage rises or falls by 5% with the sign of last period's profit
+    def __init__(self, Delta=0.0):
+        self.w = 1.0
+        self.Delta = Delta
+
+    def wage(self, prev_profit, out=None):
+        out = np.sign(prev_profit, out=out)
+        out *= 0.05
+        out += 1.0
+        return out
+
+
+class PolicySimulator:
+    # advances all K shock series together, the policy only decides wage and adjustment
+    path_names = ('ell', 'w', 'profit')
+
+    def __init__(self, eta, iota, R):
+        self.eta = eta
+        self.iota = iota
+        self.R = R
+
+    def simulate(self, policy, shocks, record=None):
+        # record: optional .npy filename, the (ell, w, profit) paths are written to a
+        # memory-mapped (3, T, K) array and exposed as (K, T) views in self.paths
+        start = time.perf_counter()
+        K, T = shocks.shape
+
+        # a. state and work arrays, allocated once and updated in place
+        ell_prev = np.zeros(K)
+        ell_ast = np.empty(K)
+        prev_profit = np.zeros(K)
+        profit = np.empty(K)
+        w = np.empty(K)
+        kappa = np.empty(K)
+        adjust = np.empty(K, dtype=bool)
+        buffer = np.empty(K)
+        ex_post_values = np.zeros(K)
+        self.adjustments = np.zeros(K, dtype=int)
+
+        if record is not None:
+            paths = np.lib.format.open_memmap(record, mode='w+', dtype=float, shape=(len(self.path_names), T, K))
+            self.paths = {name: paths[i].T for i, name in enumerate(self.path_names)}
+
+        # b. time loop
+        for t in range(T):
+            np.exp(shocks[:, t], out=kappa)
+            w[:] = policy.wage(prev_profit, out=w)
+
+            np.multiply(1 - self.eta, kappa, out=ell_ast)
+            ell_ast /= w
+            ell_ast **= 1 / self.eta
+            policy.adjust(ell_prev, ell_ast, out=adjust)
+
+            # profit = kappa * ell_ast ** (-eta) * ell_ast - w * ell_ast - iota * adjust
+            np.power(ell_ast, -self.eta, out=profit)
+            profit *= kappa
+            profit *= ell_ast
+            np.multiply(w, ell_ast, out=buffer)
+            profit -= buffer
+            np.multiply(self.iota, adjust, out=buffer)
+            profit -= buffer
+
+            np.multiply(self.R ** (-t), profit, out=buffer)
+            ex_post_values += buffer
+            self.adjustments += adjust
+
+            if record is not None:
+                paths[0, t] = ell_ast
+                paths[1, t] = w
+                paths[2, t] = profit
+
+            ell_prev, ell_ast = ell_ast, ell_prev
+            prev_profit, profit = profit, prev_profit
+
+        if record is not None:
+            paths.flush()
+
+        self.elapsed = time.perf_counter() - start
+        return ex_post_values
+
+    def simulate_streaming(self, policy, sigma_epsilon, T, tol=None, time_budget=None, max_K=None, batch_size=100, rng=None):
+        # simulate batches of new shock series until the standard error of the mean is
+        # below tol, time_budget seconds have passed or max_K series have been used,
+        # keeping only a running mean and sum of squared deviations (Welford/Chan)
+        if tol is None and time_budget is None and max_K is None:
+            raise ValueError('give at least one of tol, time_budget and max_K')
+
+        start = time.perf_counter()
+        n = 0
+        mean = 0.0
+        M2 = 0.0
+        std_error = np.inf
+
+        while True:
+            K = batch_size if max_K is None else min(batch_size, max_K - n)
+            ex_post_values = self.simulate(policy, draw_shocks(sigma_epsilon, K, T, rng))
+
+            # combine the batch with the running moments
+            mean_b = np.mean(ex_post_values)
+            M2_b = np.sum((ex_post_values - mean_b) ** 2)
+            delta = mean_b - mean
+            M2 += M2_b + delta ** 2 * n * K / (n + K)
+            n += K
+            mean += delta * K / n
+            if n > 1:
+                std_error = np.sqrt(M2 / (n - 1) / n)
+
+            if tol is not None and std_error < tol:
+                break
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+            if max_K is not None and n >= max_K:
+                break
+
+        self.n_series = n
+        self.elapsed = time.perf_counter() - start
+        return mean, std_error
+
+    def simulate_parallel(self, policy, sigma_epsilon, K, T, seed=None, n_chunks=8, workers=None, batch_size=1000):
+        # split the K series into n_chunks with independent streams spawned from seed,
+        # the result only depends on seed and n_chunks, not on the number of workers
+        seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.entropy = seed_seq.entropy # replay a run with seed=self.entropy
+        seeds = seed_seq.spawn(n_chunks)
+        sizes = [K // n_chunks + (i < K % n_chunks) for i in range(n_chunks)]
+
+        start = time.perf_counter()
+        args = [(self.eta, self.iota, self.R, policy, sigma_epsilon, size, T, child, batch_size) for size, child in zip(sizes, seeds)]
+        if workers == 1:
+            chunks = [simulate_chunk(*arg) for arg in args]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = list(executor.map(simulate_chunk, *zip(*args)))
+
+        self.elapsed = time.perf_counter() - start
+        return np.concatenate(chunks)
+
+
+class SimulatedValue:
+    # shared simulation entry points for the calculators, each builds its wage and
+    # adjustment rule in policy(*policy_args)
+
+    def calculate_ex_ante_value_streaming(self, *policy_args, tol=None, time_budget=None, max_K=None, batch_size=100):
+        self.simulator = PolicySimulator(self.eta, self.iota, self.R)
+        return self.simulator.simulate_streaming(self.policy(*policy_args), self.sigma_epsilon, self.T, tol, time_budget, max_K, batch_size, self.rng)
+
+    def calculate_ex_ante_value_parallel(self, *policy_args, seed=None, n_chunks=8, workers=None):
+        self.simulator = PolicySimulator(self.eta, self.iota, self.R)
+        ex_post_values = self.simulator.simulate_parallel(self.policy(*policy_args), self.sigma_epsilon, self.K, self.T, seed, n_chunks, workers)
+
+        ex_ante_value = np.mean(ex_post_values)
+        std_error = np.std(ex_post_values, ddof=1) / np.sqrt(self.K)
+        return ex_ante_value, std_error
+
+
+class ExAnteValueCalculator(SimulatedValue):
+    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K, rng=None):
         self.eta = eta
         self.w = w
         self.rho = rho
@@ -13,6 +223,7 @@ class ExAnteValueCalculator:
         self.R = R
         self.T = T
         self.K = K
+        self.rng = make_rng(rng)
     
     def calculate_profit_b(self, kappa, ell, t):
         ell = (((1 - self.eta) * kappa) / self.w) ** (1 / self.eta)
@@ -33,20 +244,29 @@ class ExAnteValueCalculator:
 
         return ex_post_value
 
-    def calculate_ex_ante_value(self):
-        ex_ante_values = []
+    def policy(self):
+        return Policy(self.w)
 
-        for k in range(self.K):
-            shock_series = np.random.uniform(-0.5 * self.sigma_epsilon ** 2, self.sigma_epsilon, self.T)
-            ex_post_value = self.calculate_ex_post_value(shock_series)
-            ex_ante_values.append(ex_post_value)
+    def draw_shocks(self):
+        return draw_shocks(self.sigma_epsilon, self.K, self.T, self.rng)
 
-        ex_ante_value = np.mean(ex_ante_values)
+    def calculate_ex_post_values(self, shocks):
+        simulator = PolicySimulator(self.eta, self.iota, self.R)
+        return simulator.simulate(self.policy(), shocks)
+
+    def calculate_ex_ante_value_vec(self):
+        ex_post_values = self.calculate_ex_post_values(self.draw_shocks())
+        ex_ante_value = np.mean(ex_post_values)
+        std_error = np.std(ex_post_values, ddof=1) / np.sqrt(self.K)
+        return ex_ante_value, std_error
+
+    def calculate_ex_ante_value(self):
+        ex_ante_value, std_error = self.calculate_ex_ante_value_vec()
         return ex_ante_value
 
 
-class ExAnteValueCalculator_a:
-    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K, Delta):
+class ExAnteValueCalculator_a(SimulatedValue):
+    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K, Delta, rng=None):
         self.eta = eta
         self.w = w
         self.rho = rho
@@ -55,6 +275,7 @@ class ExAnteValueCalculator_a:
         self.R = R
         self.T = T
         self.K = K
+        self.rng = make_rng(rng)
         self.Delta = Delta
 
     def calculate_profit_c(self, kappa, ell_prev, t):
@@ -76,20 +297,20 @@ class ExAnteValueCalculator_a:
 
         return ex_post_value
 
-    def calculate_ex_ante_value(self):
-        ex_ante_values = []
+    def policy(self):
+        return DeltaPolicy(self.w, self.Delta)
 
-        for k in range(self.K):
-            shock_series = np.random.uniform(-0.5 * self.sigma_epsilon ** 2, self.sigma_epsilon, self.T)
-            ex_post_value = self.calculate_ex_post_value_b(shock_series)
-            ex_ante_values.append(ex_post_value)
+    def calculate_ex_ante_value(self):
+        shocks = draw_shocks(self.sigma_epsilon, self.K, self.T, self.rng)
+        simulator = PolicySimulator(self.eta, self.iota, self.R)
+        ex_post_values = simulator.simulate(self.policy(), shocks)
 
-        ex_ante_value = np.mean(ex_ante_values)
+        ex_ante_value = np.mean(ex_post_values)
         return ex_ante_value
 
 
-class ExAnteValueCalculator_b:
-    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K):
+class ExAnteValueCalculator_b(SimulatedValue):
+    def __init__(self, eta, w, rho, iota, sigma_epsilon, R, T, K, rng=None):
         self.eta = eta
         self.w = w
         self.rho = rho
@@ -98,6 +319,7 @@ class ExAnteValueCalculator_b:
         self.R = R
         self.T = T
         self.K = K
+        self.rng = make_rng(rng)
 
     def calculate_profit_d(self, kappa, ell_prev, t, Delta):
         ell_ast = (((1 - self.eta) * kappa) / self.w) ** (1 / self.eta)
@@ -118,16 +340,17 @@ class ExAnteValueCalculator_b:
 
         return ex_post_value
 
+    def policy(self, Delta):
+        return DeltaPolicy(self.w, Delta)
+
     def find_optimal_delta(self, delta_values):
         ex_ante_values = []
 
+        simulator = PolicySimulator(self.eta, self.iota, self.R)
         for delta in delta_values:
-            ex_ante_sum = 0
-            for k in range(self.K):
-                shock_series = np.random.uniform(-0.5 * self.sigma_epsilon ** 2, self.sigma_epsilon, self.T)
-                ex_post_value = self.calculate_ex_post_value_c(shock_series, delta)
-                ex_ante_sum += ex_post_value
-            ex_ante_value = ex_ante_sum / self.K
+            shocks = draw_shocks(self.sigma_epsilon, self.K, self.T, self.rng)
+            ex_post_values = simulator.simulate(self.policy(delta), shocks)
+            ex_ante_value = np.mean(ex_post_values)
             ex_ante_values.append(ex_ante_value)
 
         optimal_delta = delta_values[np.argmax(ex_ante_values)]
@@ -135,17 +358,99 @@ class ExAnteValueCalculator_b:
 
         return optimal_delta, max_ex_ante_value, ex_ante_values
 
-    def plot_ex_ante_values(self, delta_values, ex_ante_values):
+    def draw_shocks(self):
+        # common random numbers: drawn once and reused for every Delta
+        self.shocks = draw_shocks(self.sigma_epsilon, self.K, self.T, self.rng)
+        self.delta_cache = {}
+        return self.shocks
+
+    def calculate_ex_post_values_crn(self, delta_values, shocks=None):
+        if shocks is None:
+            shocks = self.shocks if hasattr(self, 'shocks') else self.draw_shocks()
+        K, T = shocks.shape
+
+        # the labor path does not depend on Delta, only whether the adjustment cost is paid
+        kappa = np.exp(shocks)
+        ell = (((1 - self.eta) * kappa) / self.w) ** (1 / self.eta)
+        price = kappa * ell ** (-self.eta)
+        profit = price * ell - self.w * ell
+        discount = self.R ** (-np.arange(T))
+        ell_prev = np.hstack([np.zeros((K, 1)), ell[:, :-1]])
+        distance = np.abs(ell_prev - ell)
+
+        # number of Delta values below each distance, the cost is paid for exactly those
+        delta_values = np.asarray(delta_values)
+        order = np.argsort(delta_values)
+        count = np.searchsorted(delta_values[order], distance, side='left')
+
+        # discounted costs binned by count, summed from the top to get the cost for each Delta
+        n = delta_values.size
+        bins = (np.arange(K)[:, np.newaxis] * (n + 1) + count).ravel()
+        weights = np.broadcast_to(discount, (K, T)).ravel()
+        cost = np.bincount(bins, weights, K * (n + 1)).reshape(K, n + 1)
+        cost = np.cumsum(cost[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+        ex_post_values = np.empty((K, n))
+        ex_post_values[:, order] = (profit @ discount)[:, np.newaxis] - self.iota * cost
+        return ex_post_values
+
+    def find_optimal_delta_crn(self, delta_values, shocks=None, z=1.96):
+        ex_post_values = self.calculate_ex_post_values_crn(delta_values, shocks)
+        K = ex_post_values.shape[0]
+
+        ex_ante_values = np.mean(ex_post_values, axis=0)
+        std_errors = np.std(ex_post_values, axis=0, ddof=1) / np.sqrt(K)
+        lower = ex_ante_values - z * std_errors
+        upper = ex_ante_values + z * std_errors
+
+        optimal_delta = delta_values[np.argmax(ex_ante_values)]
+        max_ex_ante_value = np.max(ex_ante_values)
+
+        return optimal_delta, max_ex_ante_value, ex_ante_values, lower, upper
+
+    def calculate_ex_ante_values_cached(self, delta_values):
+        if not hasattr(self, 'shocks'):
+            self.draw_shocks()
+
+        # only simulate Delta values not seen before with the current shocks
+        new = np.unique([delta for delta in delta_values if delta not in self.delta_cache])
+        if new.size > 0:
+            ex_ante_values = np.mean(self.calculate_ex_post_values_crn(new), axis=0)
+            self.delta_cache.update(zip(new.tolist(), ex_ante_values))
+
+        return np.array([self.delta_cache[delta] for delta in delta_values])
+
+    def optimise_delta(self, lower=0.0, upper=0.2, n=11, tol=1e-5, max_iter=50):
+        # coarse-to-fine search: evaluate n points and zoom in around the best one
+        evaluations = len(getattr(self, 'delta_cache', {}))
+
+        for it in range(max_iter):
+            delta_values = np.linspace(lower, upper, n).tolist()
+            ex_ante_values = self.calculate_ex_ante_values_cached(delta_values)
+            i = np.argmax(ex_ante_values)
+
+            lower = delta_values[max(i - 1, 0)]
+            upper = delta_values[min(i + 1, n - 1)]
+            if upper - lower < tol:
+                break
+
+        self.evaluations = len(self.delta_cache) - evaluations
+        optimal_delta = delta_values[i]
+        max_ex_ante_value = ex_ante_values[i]
+
+        return optimal_delta, max_ex_ante_value
+
+    def plot_ex_ante_values(self, delta_values, ex_ante_values, lower=None, upper=None):
         plt.plot(delta_values, ex_ante_values)
+        if lower is not None and upper is not None:
+            plt.fill_between(delta_values, lower, upper, alpha=0.3)
         plt.xlabel("Delta")
         plt.ylabel("Ex Ante Value (H)")
         plt.title("Ex Ante Value (H) vs. Delta")
         plt.show()
 
-import numpy as np
-
-class ExAnteValueCalculator_c:
-    def __init__(self, eta, rho, iota, sigma_epsilon, R, T, K):
+class ExAnteValueCalculator_c(SimulatedValue):
+    def __init__(self, eta, rho, iota, sigma_epsilon, R, T, K, rng=None):
         self.eta = eta
         self.rho = rho
         self.iota = iota
@@ -153,6 +458,7 @@ class ExAnteValueCalculator_c:
         self.R = R
         self.T = T
         self.K = K
+        self.rng = make_rng(rng)
 
     def calculate_wage(self, prev_profit):
         w = 1.0 + 0.05 * np.sign(prev_profit)
@@ -166,26 +472,15 @@ class ExAnteValueCalculator_c:
         profit = price * ell_ast - w * ell_ast - adjustment_cost
         return ell_ast, profit, w
 
-    def calculate_ex_ante_value_b(self, delta):
-        ex_ante_sum = 0.0
-
-        for k in range(self.K):
-            ell_prev = 0.0
-            ex_post_value = 0.0
-            ex_ante_value = 0.0
-            prev_profit = 0.0
-
-            shock_series = np.random.uniform(-0.5 * self.sigma_epsilon ** 2, self.sigma_epsilon, self.T)
-
-            for t in range(self.T):
-                kappa = np.exp(shock_series[t])
-                ell, profit, wage = self.calculate_profit_e(kappa, ell_prev, t, prev_profit)
-                ex_post_value += self.R ** (-t) * profit
-                ex_ante_value += self.R ** (-t) * profit
-                ell_prev = ell
-                prev_profit = profit
+    def policy(self):
+        return ProfitWagePolicy()
 
-            ex_ante_sum += ex_ante_value
+    def calculate_ex_ante_value_b(self, delta, record=None):
+        # as before the adjustment cost is paid on any change in labor, delta is not used
+        # record: optional .npy filename for the simulated paths, see PolicySimulator
+        shocks = draw_shocks(self.sigma_epsilon, self.K, self.T, self.rng)
+        self.simulator = PolicySimulator(self.eta, self.iota, self.R)
+        ex_post_values = self.simulator.simulate(self.policy(), shocks, record)
 
-        ex_ante_value = ex_ante_sum / self.K
+        ex_ante_value = np.mean(ex_post_values)
         return ex_ante_value
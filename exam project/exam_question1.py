@@ -2,6 +2,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from types import SimpleNamespace
 from scipy import optimize
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 
 def private_consumption(kappa,tau,wage,L):
     """Calculates comsuption that subjects the labor supply"""
@@ -26,13 +29,58 @@ def value_of_choice(L,G,alpha,nu,kappa,tau,wage):
     return utility_worker(c,L,G,alpha,nu)
 
 
-def optimal_labor_supply(alpha,nu,kappa,tau,wage):
-    """Finds the optimal labor supply given the parameters"""
-    
-    obj = lambda L: -value_of_choice(L, 1, alpha, nu, kappa, tau, wage) #1 because G doesnt affect L
-    sol = optimize.minimize_scalar(obj, bounds=(0, 24), method='bounded')
-    
-    return sol.x
+def optimal_labor_supply(alpha,nu,kappa,tau,wage,method='analytic'):
+    """Finds the optimal labor supply given the parameters, the parameters can be arrays
+
+    method='analytic' uses the closed form (falling back to the FOC where it does not apply),
+    'foc' solves the first order condition by batched bisection and 'scalar' uses the
+    original bounded minimize_scalar for scalar parameters
+    """
+
+    if method == 'scalar':
+        obj = lambda L: -value_of_choice(L, 1, alpha, nu, kappa, tau, wage) #1 because G doesnt affect L
+        sol = optimize.minimize_scalar(obj, bounds=(0, 24), method='bounded')
+        return sol.x
+
+    alpha,nu,kappa,tau,wage = np.broadcast_arrays(*[np.asarray(x,dtype=float) for x in (alpha,nu,kappa,tau,wage)])
+    tax_wage = (1-tau)*wage
+
+    if method == 'analytic':
+        #working does not increase consumption when the after tax wage is not positive, so L = 0 there
+        L = np.zeros(tax_wage.shape)
+        I = tax_wage > 0
+        L[I] = np.clip(expected_L(kappa[I],alpha[I],nu[I],tax_wage[I]),0,24)
+    else:
+        L = solve_foc_labor(alpha,nu,kappa,tau,wage)
+
+    return L[()]
+
+def foc_labor(L,alpha,nu,kappa,tau,wage):
+    """Derivative of value_of_choice with respect to L"""
+
+    tax_wage = (1-tau)*wage
+    return alpha*tax_wage/(kappa+tax_wage*L) - nu*L
+
+def solve_foc_labor(alpha,nu,kappa,tau,wage,tol=1e-12,max_iter=100):
+    """Solves the first order condition for L in [0,24] by bisection for all parameters at once"""
+
+    shape = np.broadcast(alpha,nu,kappa,tau,wage).shape
+    low = np.zeros(shape)
+    high = np.full(shape,24.0)
+
+    #with a positive after tax wage the foc is decreasing in L, so corners are found when it has the
+    #same sign on the whole interval, otherwise working does not increase consumption and L = 0
+    positive = np.broadcast_to((1-tau)*wage > 0,shape)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        for it in range(max_iter):
+            mid = (low+high)/2
+            I = (foc_labor(mid,alpha,nu,kappa,tau,wage) > 0) & positive
+            low = np.where(I,mid,low)
+            high = np.where(I,high,mid)
+            if np.max(high-low,initial=0) < tol:
+                break
+
+    return np.where(positive,(low+high)/2,0.0)
 
 def expected_L(kappa,alpha,nu,tax_wage):
     return (-kappa+(kappa**2 +4*(alpha/nu)*tax_wage**2)**(1/2))/(2*tax_wage)
@@ -43,11 +91,90 @@ def gov_endogenous(alpha,nu,kappa,tau,wage):
     L = optimal_labor_supply(alpha,nu,kappa,tau,wage)
     return tau*wage*L
 
-def optimal_tau(alpha,nu,kappa,wage):
-    """Returns the optimal value of tau that maximizes the return of value_of_choice function"""
-    obj = lambda tau: -value_of_choice(optimal_labor_supply(alpha,nu,kappa,tau,wage),
-                                       gov_endogenous(alpha,nu,kappa,tau,wage), alpha, nu, kappa, tau, wage)
+@lru_cache(maxsize=1024)
+def optimal_labor_supply_cached(alpha,nu,kappa,tau,wage):
+    """Memoised optimal labor supply for scalar parameters (LRU bounded)"""
+
+    return optimal_labor_supply(alpha,nu,kappa,tau,wage)
+
+def optimal_tau(alpha,nu,kappa,wage,return_counts=False):
+    """Returns the optimal value of tau that maximizes the return of value_of_choice function
+
+    The labor supply is solved once per tau and memoised, with return_counts=True
+    the number of outer (tau) and inner (labor supply) evaluations is also returned
+    """
+
+    counts = SimpleNamespace(outer=0,inner=0)
+    misses = optimal_labor_supply_cached.cache_info().misses
+
+    def obj(tau):
+        counts.outer += 1
+        L = optimal_labor_supply_cached(alpha,nu,kappa,tau,wage)
+        G = tau*wage*L #same as gov_endogenous without solving for L again
+        return -value_of_choice(L,G,alpha,nu,kappa,tau,wage)
     
     sol = optimize.minimize_scalar(obj, bounds=(0, 1), method='bounded')
+    counts.inner = optimal_labor_supply_cached.cache_info().misses - misses
+
+    if return_counts:
+        return sol.x, counts
     
     return sol.x
+
+def surface_chunk(alpha,nu,kappa,tau,wage):
+    """Optimal labor supply, government consumption and utility for one chunk of parameters"""
+
+    L = optimal_labor_supply(alpha,nu,kappa,tau,wage)
+    G = tau*wage*L
+    u = value_of_choice(L,G,alpha,nu,kappa,tau,wage)
+
+    return L,G,u
+
+def surface_range(pars,i0,i1):
+    """surface_chunk for the points i0 to i1 of the broadcast grid of pars
+
+    pars are the un-broadcast parameter arrays, the chunk is gathered from broadcast views
+    without expanding the full grid, so only the small inputs are sent to a worker
+    """
+
+    pars = np.broadcast_arrays(*pars)
+    idx = np.unravel_index(np.arange(i0,i1),pars[0].shape)
+
+    return surface_chunk(*[x[idx] for x in pars])
+
+def labor_surface(alpha,nu,kappa,tau,wage,chunk_size=2**18,workers=None):
+    """Optimal labor supply, government consumption and utility on the broadcast grid of the parameters
+
+    The grid is solved in chunks of at most chunk_size points so temporaries stay bounded,
+    with workers > 1 the chunks are spread over a process pool with at most 2*workers chunks in flight
+    """
+
+    pars = [np.asarray(x,dtype=float) for x in (alpha,nu,kappa,tau,wage)]
+    shape = np.broadcast_shapes(*[x.shape for x in pars])
+    N = int(np.prod(shape))
+
+    L = np.empty(N)
+    G = np.empty(N)
+    u = np.empty(N)
+
+    def store(i0,result):
+        L_,G_,u_ = result
+        L[i0:i0+L_.size],G[i0:i0+L_.size],u[i0:i0+L_.size] = L_,G_,u_
+
+    starts = range(0,N,chunk_size)
+    if workers is None or workers == 1:
+        for i0 in starts:
+            store(i0,surface_range(pars,i0,min(i0+chunk_size,N)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = deque()
+            for i0 in starts:
+                if len(in_flight) == 2*workers:
+                    i0_done,future = in_flight.popleft()
+                    store(i0_done,future.result())
+                in_flight.append((i0,executor.submit(surface_range,pars,i0,min(i0+chunk_size,N))))
+            while in_flight:
+                i0_done,future = in_flight.popleft()
+                store(i0_done,future.result())
+
+    return L.reshape(shape),G.reshape(shape),u.reshape(shape)
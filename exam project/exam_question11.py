@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from types import SimpleNamespace
 from scipy import optimize
+from collections import OrderedDict
 
 G = 1
 
@@ -28,15 +29,137 @@ def final_utility(alpha, G, sigma, rho, nu, L, epsilon, kappa, tau, wage):
     return utility_worker(alpha, c, G, sigma, rho, nu, L, epsilon)
 
 
-def optimize_L(alpha, sigma, rho, nu, epsilon, kappa, tau, wage):
+def optimize_L(alpha, sigma, rho, nu, epsilon, kappa, tau, wage, bounds=(0, 24)):
     """Finds the optimal labor supply given the parameters"""
 
     obj = lambda L: -final_utility(alpha, G, sigma, rho, nu, L, epsilon, kappa, tau, wage)
 
-    sol = optimize.minimize_scalar(obj, bounds=(0, 24), method='bounded')
+    sol = optimize.minimize_scalar(obj, bounds=bounds, method='bounded')
     return sol.x
 
 
+def optimize_L_vec(alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G, tol=1e-10):
+    """Finds the optimal labor supply in [0, 24] for arrays of parameters (and G) by golden section search"""
+
+    alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G)])
+    def obj(L):
+        with np.errstate(invalid='ignore'):
+            u = final_utility(alpha, G, sigma, rho, nu, L, epsilon, kappa, tau, wage)
+        return np.where(np.isnan(u), -np.inf, u) # utility is not defined everywhere
+
+    invphi = (np.sqrt(5) - 1) / 2
+    a = np.zeros(tau.shape)
+    b = np.full(tau.shape, 24.0)
+    c = b - invphi * (b - a)
+    d = a + invphi * (b - a)
+    fc = obj(c)
+    fd = obj(d)
+
+    while np.max(b - a, initial=0) > tol:
+        I = fc > fd # the maximum is in [a, d]
+        b = np.where(I, d, b)
+        a = np.where(I, a, c)
+        c_new = np.where(I, b - invphi * (b - a), d)
+        d_new = np.where(I, c, a + invphi * (b - a))
+        f_new = obj(np.where(I, c_new, d_new))
+        fc, fd = np.where(I, f_new, fd), np.where(I, fc, f_new)
+        c, d = c_new, d_new
+
+    return (a + b) / 2
+
+def equilibrium_G(alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G0=1.0, tol=1e-6, max_iter=100, accelerate=True):
+    """Solves the fixed point G = tau * wage * L*(G) for arrays of parameters at once
+
+    All cases are iterated together with vectorised inner solves. With accelerate=True each
+    case uses Anderson acceleration with memory one (a secant step on G - tau*w*L*(G)), falling
+    back to the plain iteration when the step is not usable. Returns G, L and diagnostics
+    (iterations and final residual per case, converged mask and number of inner solves).
+    """
+
+    pars = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G0)])
+    alpha, sigma, rho, nu, epsilon, kappa, tau, wage, G = [x.ravel().copy() for x in pars]
+    shape = pars[0].shape
+    N = G.size
+
+    L = np.zeros(N)
+    F_prev = np.full(N, np.nan)
+    r_prev = np.full(N, np.nan)
+    residual = np.full(N, np.inf)
+    iterations = np.zeros(N, dtype=int)
+    active = np.ones(N, dtype=bool)
+    inner_solves = 0
+
+    for it in range(max_iter):
+
+        # a. labor supply and implied G for the cases not yet converged
+        i = np.flatnonzero(active)
+        L[i] = optimize_L_vec(alpha[i], sigma[i], rho[i], nu[i], epsilon[i], kappa[i], tau[i], wage[i], G[i])
+        inner_solves += i.size
+        F = new_G(tau[i], wage[i], L[i])
+        r = F - G[i]
+        residual[i] = np.abs(r)
+        iterations[i] += 1
+
+        # b. converged cases keep G
+        done = residual[i] < tol
+        active[i[done]] = False
+
+        # c. next guess
+        G_next = F
+        if accelerate:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                theta = r / (r - r_prev[i])
+                G_acc = F - theta * (F - F_prev[i])
+            ok = np.isfinite(G_acc) & (G_acc >= 0)
+            G_next = np.where(ok, G_acc, F)
+
+        F_prev[i] = F
+        r_prev[i] = r
+        G[i[~done]] = G_next[~done]
+
+        if not np.any(active):
+            break
+
+    info = SimpleNamespace(iterations=iterations.reshape(shape), residual=residual.reshape(shape), converged=~active.reshape(shape), inner_solves=inner_solves)
+
+    return G.reshape(shape), L.reshape(shape), info
+
+
+class CachedLaborSupply:
+
+    def __init__(self, maxsize=1024):
+        """LRU cache of optimize_L solutions keyed by the parameters
+
+        Every solve is over the full (0, 24) interval, so a cached value does not depend on what was solved before
+        """
+
+        self.cache = OrderedDict()
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, alpha, sigma, rho, nu, epsilon, kappa, tau, wage):
+
+        key = (alpha, sigma, rho, nu, epsilon, kappa, tau, wage)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        self.misses += 1
+
+        L = optimize_L(alpha, sigma, rho, nu, epsilon, kappa, tau, wage)
+
+        self.cache[key] = L
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+        return L
+
+labor_supply = CachedLaborSupply()
+
+
 def new_G(tau, wage, L):
     """New formula for gov consumption"""
     
@@ -45,16 +168,32 @@ def new_G(tau, wage, L):
 def solve_G(alpha, sigma, rho, nu, epsilon, kappa, tau, wage):
     """Solve for the government spending given the parameters"""
     # Find the optimal labor supply
-    L_solve = optimize_L(alpha, sigma, rho, nu, epsilon, kappa, tau, wage)
+    L_solve = labor_supply(alpha, sigma, rho, nu, epsilon, kappa, tau, wage)
     
     # Calculate the optimal government spending
     G_solve = new_G(tau, wage, L_solve)
     
     return G_solve
 
-def optimal_tax(alpha, sigma, rho, nu, epsilon, kappa, wage):
+def optimal_tax(alpha, sigma, rho, nu, epsilon, kappa, wage, return_counts=False):
+    """Finds the tax rate that maximizes the utility of the worker
+
+    The labor supply is solved once per tau through the labor_supply cache, with
+    return_counts=True the number of outer (tau) and inner (labor supply) evaluations is also returned
+    """
+
+    counts = SimpleNamespace(outer=0, inner=0)
+    misses = labor_supply.misses
+
+    def obj(tau):
+        counts.outer += 1
+        L = labor_supply(alpha, sigma, rho, nu, epsilon, kappa, tau, wage)
+        return -final_utility(alpha, new_G(tau, wage, L), sigma, rho, nu, L, epsilon, kappa, tau, wage)
 
-    obj = lambda tau: -final_utility(alpha, solve_G(alpha, sigma, rho, nu, epsilon, kappa, tau, wage), sigma, rho, nu, optimize_L(alpha, sigma, rho, nu, epsilon, kappa, tau, wage), epsilon, kappa, tau, wage)
     sol = optimize.minimize_scalar(obj, bounds=(0,1), method='bounded')
+    counts.inner = labor_supply.misses - misses
+
+    if return_counts:
+        return sol.x, counts
 
     return sol.x
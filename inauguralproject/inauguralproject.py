@@ -1,4 +1,8 @@
 from types import SimpleNamespace
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
 
 import numpy as np
 from scipy import optimize
@@ -6,6 +10,290 @@ from scipy import optimize
 import pandas as pd 
 import matplotlib.pyplot as plt
 
+class UtilityKernel:
+
+    sigma_tol = 1e-8 # sigma closer than this to 0 or 1 uses the limiting home production
+
+    def __init__(self,par):
+        """ household utility for one parameter set with precomputed constants """
+
+        # a. parameters
+        self.wM = par.wM
+        self.wF = par.wF
+        self.nu = par.nu
+        self.alpha = par.alpha
+        self.omega = par.omega
+
+        # b. exponents
+        self.one_alpha = 1-par.alpha
+        self.one_omega = 1-par.omega
+        self.one_rho = 1-par.rho
+        self.epsilon_ = 1+1/par.epsilon
+
+        # c. home production (including the limits sigma -> 0 and sigma -> 1)
+        if par.sigma < self.sigma_tol:
+            self.home = 'leontief'
+        elif abs(par.sigma-1) < self.sigma_tol:
+            self.home = 'cobb-douglas'
+        else:
+            self.home = 'ces'
+            self.s = (par.sigma-1)/par.sigma
+            self.s_inv = par.sigma/(par.sigma-1)
+
+        # d. scratch buffers, only kept for the most recent shape
+        self.buffers_shape = None
+        self.buffers = {}
+
+    def buffer(self,shape,i):
+        """ reusable scratch array number i """
+
+        if shape != self.buffers_shape:
+            self.buffers_shape = shape
+            self.buffers = {}
+
+        if i not in self.buffers:
+            self.buffers[i] = np.empty(shape)
+
+        return self.buffers[i]
+
+    def consumption(self,LM,LF,wF=None,out=None,buf=None):
+        """ consumption of market goods """
+
+        wF = self.wF if wF is None else wF
+        if out is None:
+            return self.wM*LM + wF*LF
+
+        np.multiply(self.wM,LM,out=out)
+        np.multiply(wF,LF,out=buf)
+        out += buf
+
+        return out
+
+    def home_production(self,HM,HF,out=None,buf=None):
+        """ home production """
+
+        if self.home == 'leontief':
+            return np.fmin(HM,HF,out=out)
+
+        if out is None:
+            out = np.empty(np.broadcast_shapes(np.shape(HM),np.shape(HF)))
+            buf = np.empty(out.shape)
+            m = np.empty(out.shape)
+        else:
+            m = self.buffer(out.shape,2)
+
+        if self.home == 'cobb-douglas':
+            np.power(HM,self.one_alpha,out=out)
+            np.power(HF,self.alpha,out=buf)
+            out *= buf
+        else:
+            # scaled by m = min(HM,HF) for sigma < 1 (s < 0) and m = max(HM,HF) for sigma > 1,
+            # so (HM/m)**s and (HF/m)**s are at most 1 and do not overflow for sigma close to 0
+            if self.s < 0:
+                np.fmin(HM,HF,out=m)
+            else:
+                np.fmax(HM,HF,out=m)
+            with np.errstate(divide='ignore',invalid='ignore',over='ignore'):
+                np.divide(HM,m,out=out)
+                out **= self.s
+                out *= self.one_alpha
+                np.divide(HF,m,out=buf)
+                buf **= self.s
+                buf *= self.alpha
+                out += buf
+                out **= self.s_inv
+            out *= m
+            np.copyto(out,0.0,where=m == 0)
+
+        return out
+
+    def consumption_utility(self,Q,out=None):
+        """ utility of the consumption aggregate Q """
+
+        out = np.fmax(Q,1e-8,out=out)
+        out **= self.one_rho
+        out /= self.one_rho
+
+        return out
+
+    def disutility(self,T,out=None):
+        """ disutility of working T hours (before scaling with nu) """
+
+        out = np.power(T,self.epsilon_,out=out)
+        out /= self.epsilon_
+
+        return out
+
+    def __call__(self,LM,HM,LF,HF,out=None):
+        """ calculate utility, all intermediate results are kept in out and reused scratch buffers """
+
+        shape = np.broadcast_shapes(np.shape(LM),np.shape(HM),np.shape(LF),np.shape(HF))
+        if out is None:
+            out = np.empty(shape)
+        buf0 = self.buffer(shape,0)
+        buf1 = self.buffer(shape,1)
+
+        # a. Q = C**omega * H**(1-omega)
+        self.consumption(LM,LF,out=buf0,buf=buf1)
+        buf0 **= self.omega
+        self.home_production(HM,HF,out=out,buf=buf1)
+        out **= self.one_omega
+        out *= buf0
+
+        # b. total consumption utility
+        self.consumption_utility(out,out=out)
+
+        # c. disutility of work
+        np.add(LM,HM,out=buf0)
+        self.disutility(buf0,out=buf0)
+        np.add(LF,HF,out=buf1)
+        self.disutility(buf1,out=buf1)
+        buf0 += buf1
+        buf0 *= self.nu
+        out -= buf0
+
+        return out[()] if out.ndim == 0 else out
+
+def feasible_pairs(x,T=24):
+    """ indices of all pairs (a,b) from the grid x with a+b <= T, a varying slowest """
+
+    a,b = np.meshgrid(np.arange(x.size),np.arange(x.size),indexing='ij')
+    I = x[a]+x[b] <= T
+
+    return a[I],b[I]
+
+def argmax_tiles(calc_tile,NM,NF,chunk_size,NB=1):
+    """ running argmax over (male choice, female choice) tiles for NB batches """
+
+    step = max(chunk_size//(NB*NF),1)
+    u_max = np.full(NB,-np.inf)
+    m_max = np.zeros(NB,dtype=int)
+    f_max = np.zeros(NB,dtype=int)
+
+    for i0 in range(0,NM,step):
+
+        i1 = min(i0+step,NM)
+        u = calc_tile(i0,i1).reshape(NB,-1)
+
+        # strict so the first maximum is kept as in a single np.argmax
+        j = np.argmax(u,axis=1)
+        u_j = u[np.arange(NB),j]
+        I = u_j > u_max
+        u_max[I] = u_j[I]
+        m_max[I] = i0+j[I]//NF
+        f_max[I] = j[I]%NF
+
+    return m_max,f_max
+
+def solve_grid(calc_utility,x,chunk_size=2**20):
+    """ maximize utility over all feasible choices on the grid x in chunks """
+
+    # a. feasible choices for each member (same ordering as the full meshgrid)
+    iHM,iLM = feasible_pairs(x)
+    iLF,iHF = feasible_pairs(x)
+    LM,HM,LF,HF = x[iLM],x[iHM],x[iLF],x[iHF]
+    NF = LF.size
+
+    # b. flat utility for chunks of male choices combined with all female choices
+    def calc_tile(i0,i1):
+        m = np.repeat(np.arange(i0,i1),NF)
+        f = np.tile(np.arange(NF),i1-i0)
+        return calc_utility(LM[m],HM[m],LF[f],HF[f])
+
+    m,f = argmax_tiles(calc_tile,LM.size,NF,chunk_size)
+
+    return LM[m[0]],HM[m[0]],LF[f[0]],HF[f[0]]
+
+def solve_grid_broadcast(kernel,x,chunk_size=2**20,wF=None):
+    """ maximize utility over all feasible choices on the grid x using separability
+
+    If wF is a vector of female wages it is solved as an extra batch axis
+    and the choices are returned as vectors of the same size.
+    """
+
+    # a. feasible choices for each member
+    iHM,iLM = feasible_pairs(x)
+    iLF,iHF = feasible_pairs(x)
+
+    # b. consumption term over the (wF,LM,LF) planes
+    wF_vec = np.atleast_1d(kernel.wF if wF is None else wF)
+    NB = wF_vec.size
+    C = kernel.consumption(x[np.newaxis,:,np.newaxis],x[np.newaxis,np.newaxis,:],wF=wF_vec[:,np.newaxis,np.newaxis])
+    C_omega = C**kernel.omega
+
+    # c. home production term over the (HM,HF) plane
+    H = kernel.home_production(x[:,np.newaxis],x[np.newaxis,:])
+    H_omega = H**kernel.one_omega
+
+    # d. disutility of work per member
+    dM = kernel.disutility(x[iLM]+x[iHM])
+    dF = kernel.disutility(x[iLF]+x[iHF])
+
+    # e. combine by broadcasting in tiles of male choices (H and disutility shared across wages)
+    def calc_tile(i0,i1):
+        m = slice(i0,i1)
+        Q = C_omega[:,iLM[m,np.newaxis],iLF] * H_omega[iHM[m,np.newaxis],iHF]
+        utility = kernel.consumption_utility(Q,out=Q)
+        utility -= kernel.nu*(dM[m,np.newaxis]+dF)
+        return utility
+
+    m,f = argmax_tiles(calc_tile,iLM.size,iLF.size,chunk_size,NB)
+    LM,HM,LF,HF = x[iLM[m]],x[iHM[m]],x[iLF[f]],x[iHF[f]]
+
+    if wF is None:
+        return LM[0],HM[0],LF[0],HF[0]
+    else:
+        return LM,HM,LF,HF
+
+def sweep_chunk(cls,par,names,values,method):
+    """ solve a fresh model for each parameter combination in values """
+
+    model = cls()
+    model.par.__dict__.update(par)
+    model.par.warm_start = False # each point must only depend on its own parameters
+
+    rows = []
+    for value in values:
+        for name,v in zip(names,value):
+            setattr(model.par,name,v)
+        opt = getattr(model,method)()
+        rows.append((opt.LM,opt.HM,opt.LF,opt.HF))
+
+    return rows
+
+def sweep(model,pars,method='solve_discrete',workers=None,chunksize=None):
+    """ solve model on the grid of all combinations of the parameter arrays in pars
+
+    The points are split into chunks which are solved in a process pool,
+    the result has one row per combination in the order of itertools.product
+    no matter the number of workers.
+    """
+
+    # a. all combinations
+    names = list(pars.keys())
+    values = list(itertools.product(*[np.atleast_1d(pars[name]) for name in names]))
+
+    # b. chunks
+    if workers is None:
+        workers = os.cpu_count()
+    if chunksize is None:
+        chunksize = max(len(values)//(4*workers),1)
+    chunks = [values[i:i+chunksize] for i in range(0,len(values),chunksize)]
+
+    # c. solve
+    args = (type(model),model.par.__dict__.copy(),names)
+    if workers == 1:
+        rows = [sweep_chunk(*args,chunk,method) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(sweep_chunk,*zip(*[args+(chunk,method) for chunk in chunks])))
+
+    # d. tidy results
+    df = pd.DataFrame(values,columns=names)
+    df[['LM','HM','LF','HF']] = np.array([row for chunk in rows for row in chunk]).reshape(-1,4)
+
+    return df
+
 #code for question 1
 class HouseholdSpecializationModelClass:
 
@@ -35,7 +323,12 @@ class HouseholdSpecializationModelClass:
         par.beta0_target = 0.4
         par.beta1_target = -0.1
 
-        # f. solution
+        # f. grid
+        par.grid_step = 0.5 # hours between grid points in solve_discrete
+        par.chunk_size = 2**20 # max number of choices evaluated at once
+        par.broadcast = True # evaluate utility from separable terms by broadcasting
+
+        # g. solution
         sol.LM_vec = np.zeros(par.wF_vec.size)
         sol.HM_vec = np.zeros(par.wF_vec.size)
         sol.LF_vec = np.zeros(par.wF_vec.size)
@@ -44,38 +337,21 @@ class HouseholdSpecializationModelClass:
         sol.beta0 = np.nan
         sol.beta1 = np.nan
 
-    def calc_utility(self,LM,HM,LF,HF):
-        """ calculate utility """
+    def utility_kernel(self):
+        """ utility kernel for the current parameters (rebuilt when par changes) """
 
         par = self.par
-        sol = self.sol
-
-        # a. consumption of market goods
-        C = par.wM*LM + par.wF*LF
-
-        # b. home production
-        #for this it depends on the values of the epsilon
-        if par.sigma == 0:
-            H = np.fmin(LM,HM)
-        elif par.sigma == 1:
-            H = HM**(1-par.alpha) * HF**par.alpha   
-            Q = C**par.omega * H**(1-par.omega)
-        else:
-            H = ((1-par.alpha)*HM**((par.sigma-1)/par.sigma) + par.alpha*HF**((par.sigma-1)/par.sigma))**(par.sigma/(par.sigma-1))
-            Q = C**par.omega * H**(1-par.omega)
+        key = (par.rho,par.nu,par.epsilon,par.omega,par.alpha,par.sigma,par.wM,par.wF)
+        if getattr(self,'kernel_key',None) != key:
+            self.kernel = UtilityKernel(par)
+            self.kernel_key = key
 
+        return self.kernel
 
-        # c. total consumption utility
-        #Q = C**par.omega*H**(1-par.omega)
-        utility = np.fmax(Q,1e-8)**(1-par.rho)/(1-par.rho)
+    def calc_utility(self,LM,HM,LF,HF,out=None):
+        """ calculate utility """
 
-        # d. disutlity of work
-        epsilon_ = 1+1/par.epsilon
-        TM = LM+HM
-        TF = LF+HF
-        disutility = par.nu*(TM**epsilon_/epsilon_+TF**epsilon_/epsilon_)
-        
-        return utility - disutility
+        return self.utility_kernel()(LM,HM,LF,HF,out=out)
             
     def solve_discrete(self,do_print=False):
         """ solve model discretely """
@@ -85,30 +361,20 @@ class HouseholdSpecializationModelClass:
         opt = SimpleNamespace()
         
         # a. all possible choices
-        x = np.linspace(0,24,49)
-        LM,HM,LF,HF = np.meshgrid(x,x,x,x) # all combinations
-    
-        LM = LM.ravel() # vector
-        HM = HM.ravel()
-        LF = LF.ravel()
-        HF = HF.ravel()
+        x = np.linspace(0,24,int(round(24/par.grid_step))+1)
 
-        # b. calculate utility
-        u = self.calc_utility(LM,HM,LF,HF)
-    
-        # c. set to minus infinity if constraint is broken
-        I = (LM+HM > 24) | (LF+HF > 24) # | is "or"
-        u[I] = -np.inf
-    
-        # d. find maximizing argument
-        j = np.argmax(u)
+        # b. maximize over choices satisfying the time constraints
+        if par.broadcast:
+            LM,HM,LF,HF = solve_grid_broadcast(self.utility_kernel(),x,par.chunk_size)
+        else:
+            LM,HM,LF,HF = solve_grid(self.calc_utility,x,par.chunk_size)
         
-        opt.LM = LM[j]
-        opt.HM = HM[j]
-        opt.LF = LF[j]
-        opt.HF = HF[j]
+        opt.LM = LM
+        opt.HM = HM
+        opt.LF = LF
+        opt.HF = HF
 
-        # e. print
+        # c. print
         
         if do_print:
             for k,v in opt.__dict__.items():
@@ -116,6 +382,11 @@ class HouseholdSpecializationModelClass:
 
         return opt
 
+    def sweep(self,pars,workers=None,chunksize=None):
+        """ solve model discretely for all combinations of the parameter arrays in pars """
+
+        return sweep(self,pars,'solve_discrete',workers,chunksize)
+
 
 
 class HouseholdSpecializationModelClass2:
@@ -146,7 +417,22 @@ class HouseholdSpecializationModelClass2:
         par.beta0_target = 0.4
         par.beta1_target = -0.1
 
-        # f. solution
+        # f. grid
+        par.grid_step = 0.5 # hours between grid points in solve_discrete
+        par.chunk_size = 2**20 # max number of choices evaluated at once
+        par.broadcast = True # evaluate utility from separable terms by broadcasting
+
+        # g. continuous solver
+        par.analytic_grad = True # closed-form gradients instead of finite differences
+        par.warm_start = False # start from the nearest previously found solution
+        par.warm_size = 128 # max number of previous solutions kept for warm starts
+        par.ftol = 1e-10 # SLSQP tolerance, the utility is very flat close to the optimum
+
+        # h. estimation
+        par.cache_decimals = 6 # alpha and sigma are rounded to this many decimals in estimate
+        par.cache_size = 512 # max number of inner solutions kept in estimate
+
+        # i. solution
         sol.LM_vec = np.zeros(par.wF_vec.size)
         sol.HM_vec = np.zeros(par.wF_vec.size)
         sol.LF_vec = np.zeros(par.wF_vec.size)
@@ -155,38 +441,28 @@ class HouseholdSpecializationModelClass2:
         sol.beta0 = np.nan
         sol.beta1 = np.nan
 
-    def calc_utility(self,LM,HM,LF,HF):
-        """ calculate utility """
+        sol.warm_pars = deque(maxlen=par.warm_size) # parameters of the most recent continuous solutions
+        sol.warm_x = deque(maxlen=par.warm_size) # most recent continuous solutions
 
-        par = self.par
-        sol = self.sol
+        sol.cache = OrderedDict() # inner solutions used in estimate (LRU)
+        sol.cache_hits = 0 # number of calc_loss calls answered from the cache
+        sol.nfev = 0 # number of loss evaluations in estimate
 
-        # a. consumption of market goods
-        C = par.wM*LM + par.wF*LF
+    def utility_kernel(self):
+        """ utility kernel for the current parameters (rebuilt when par changes) """
 
-        # b. home production
-        #for this it depends on the values of the epsilon
-        if par.sigma == 0:
-            H = np.fmin(HF,HM)
-        elif par.sigma == 1:
-            H = HM**(1-par.alpha) * HF**par.alpha   
-            Q = C**par.omega * H**(1-par.omega)
-        else:
-            H = ((1-par.alpha)*HM**((par.sigma-1)/par.sigma) + par.alpha*HF**((par.sigma-1)/par.sigma))**(par.sigma/(par.sigma-1))
-            Q = C**par.omega * H**(1-par.omega)
+        par = self.par
+        key = (par.rho,par.nu,par.epsilon,par.omega,par.alpha,par.sigma,par.wM,par.wF)
+        if getattr(self,'kernel_key',None) != key:
+            self.kernel = UtilityKernel(par)
+            self.kernel_key = key
 
+        return self.kernel
 
-        # c. total consumption utility
-        #Q = C**par.omega*H**(1-par.omega)
-        utility = np.fmax(Q,1e-8)**(1-par.rho)/(1-par.rho)
+    def calc_utility(self,LM,HM,LF,HF,out=None):
+        """ calculate utility """
 
-        # d. disutlity of work
-        epsilon_ = 1+1/par.epsilon
-        TM = LM+HM
-        TF = LF+HF
-        disutility = par.nu*(TM**epsilon_/epsilon_+TF**epsilon_/epsilon_)
-        
-        return utility - disutility
+        return self.utility_kernel()(LM,HM,LF,HF,out=out)
 
     def solve_discrete(self,do_print=False):
         """ solve model discretely """
@@ -196,73 +472,158 @@ class HouseholdSpecializationModelClass2:
         opt = SimpleNamespace()
         
         # a. all possible choices
-        x = np.linspace(0,24,49)
-        LM,HM,LF,HF = np.meshgrid(x,x,x,x) # all combinations
-    
-        LM = LM.ravel() # vector
-        HM = HM.ravel()
-        LF = LF.ravel()
-        HF = HF.ravel()
+        x = np.linspace(0,24,int(round(24/par.grid_step))+1)
 
-        # b. calculate utility
-        u = self.calc_utility(LM,HM,LF,HF)
-    
-        # c. set to minus infinity if constraint is broken
-        I = (LM+HM > 24) | (LF+HF > 24) # | is "or"
-        u[I] = -np.inf
-    
-        # d. find maximizing argument
-        j = np.argmax(u)
+        # b. maximize over choices satisfying the time constraints
+        if par.broadcast:
+            LM,HM,LF,HF = solve_grid_broadcast(self.utility_kernel(),x,par.chunk_size)
+        else:
+            LM,HM,LF,HF = solve_grid(self.calc_utility,x,par.chunk_size)
         
-        opt.LM = np.log(LM[j])
-        opt.HM = np.log(HM[j])
-        opt.LF = np.log(LF[j])
-        opt.HF = np.log(HF[j])
+        opt.LM = np.log(LM)
+        opt.HM = np.log(HM)
+        opt.LF = np.log(LF)
+        opt.HF = np.log(HF)
 
-        # e. print
+        # c. print
         if do_print:
             for k,v in opt.__dict__.items():
                 print(f'{k} = {v:6.4f}')
 
         return opt
 
+    def calc_utility_grad(self,LM,HM,LF,HF):
+        """ calculate gradient of utility wrt. (LM,HM,LF,HF) """
+
+        par = self.par
+
+        # a. consumption of market goods
+        C = par.wM*LM + par.wF*LF
+
+        # b. home production and its derivatives
+        kernel = self.utility_kernel()
+        H = kernel.home_production(HM,HF)
+        if kernel.home == 'leontief':
+            dH_dHM = 1.0*(HM <= HF)
+            dH_dHF = 1.0*(HM > HF)
+        elif kernel.home == 'cobb-douglas':
+            dH_dHM = (1-par.alpha)*H/HM
+            dH_dHF = par.alpha*H/HF
+        else:
+            # (HM/H)**(s-1) instead of HM**(s-1)*H**(1-s) so the powers do not overflow for sigma close to 0
+            dH_dHM = (1-par.alpha)*(HM/H)**(kernel.s-1)
+            dH_dHF = par.alpha*(HF/H)**(kernel.s-1)
+
+        # c. marginal utility of the consumption aggregate (zero where the floor binds)
+        Q = C**par.omega * H**(1-par.omega)
+        dU_dQ = Q**(-par.rho)*(Q > 1e-8)
+        dU_dC = dU_dQ*par.omega*Q/C
+        dU_dH = dU_dQ*(1-par.omega)*Q/H
+
+        # d. marginal disutility of work
+        epsilon_ = 1+1/par.epsilon
+        dD_dTM = par.nu*(LM+HM)**(epsilon_-1)
+        dD_dTF = par.nu*(LF+HF)**(epsilon_-1)
+
+        return np.array([dU_dC*par.wM - dD_dTM,
+                         dU_dH*dH_dHM - dD_dTM,
+                         dU_dC*par.wF - dD_dTF,
+                         dU_dH*dH_dHF - dD_dTF])
+
     def solve_continous(self,do_print=False):
         """ solve model continously """
         par = self.par
         sol = self.sol
         opt = SimpleNamespace()
+        opt.nfev = 0 # number of utility evaluations
+        opt.njev = 0 # number of gradient evaluations
 
         #we need to present our objective function that we want to maximize
         def objective_f(x):
+            opt.nfev += 1
             return -self.calc_utility(x[0], x[1], x[2], x[3])
+
+        def objective_jac(x):
+            opt.njev += 1
+            return -self.calc_utility_grad(x[0], x[1], x[2], x[3])
         
-        #now we need to presnet our constraints
+        #now we need to presnet our constraints (with their constant jacobians)
         constraint1 = lambda x: 24 - x[0] - x[1]
         constraint2 = lambda x: 24 - x[2] - x[3]
-        constraints = ({'type': 'ineq', 'fun': constraint1},{'type': 'ineq', 'fun': constraint2})
-
-        #now make the guess of the values
-        guess = [12,12,12,12]
+        if par.analytic_grad:
+            jac = objective_jac
+            constraints = ({'type': 'ineq', 'fun': constraint1, 'jac': lambda x: np.array([-1.0,-1.0,0.0,0.0])},
+                           {'type': 'ineq', 'fun': constraint2, 'jac': lambda x: np.array([0.0,0.0,-1.0,-1.0])})
+        else:
+            jac = None
+            constraints = ({'type': 'ineq', 'fun': constraint1},{'type': 'ineq', 'fun': constraint2})
+
+        #now make the guess of the values (nearest previous solution if warm starting)
+        pars = np.array([par.rho,par.nu,par.epsilon,par.omega,par.alpha,par.sigma,par.wM,par.wF])
+        if par.warm_start and len(sol.warm_pars) > 0:
+            dist = np.linalg.norm(np.array(sol.warm_pars)-pars,axis=1)
+            guess = sol.warm_x[np.argmin(dist)]
+        else:
+            guess = [12,12,12,12]
 
         #now create the boundaries for the values 
         bounds = ((0,24),(0,24),(0,24),(0,24))
 
         #now create the minimize function with the previous parameters
-        solution = optimize.minimize(objective_f,guess,method='SLSQP',bounds=bounds,constraints=constraints)
+        solution = optimize.minimize(objective_f,guess,jac=jac,method='SLSQP',bounds=bounds,constraints=constraints,options={'ftol':par.ftol})
         
         #give the final values to the variables
         opt.LM = solution.x[0]
         opt.HM = solution.x[1]
         opt.LF = solution.x[2]
         opt.HF = solution.x[3]
+
+        #remember the solution for later warm starts
+        if par.warm_start:
+            sol.warm_pars.append(pars)
+            sol.warm_x.append(solution.x)
+
+        if do_print:
+            print(f'utility evaluations = {opt.nfev}, gradient evaluations = {opt.njev}')
         
         return opt
 
+    def sweep(self,pars,discrete=True,workers=None,chunksize=None):
+        """ solve model for all combinations of the parameter arrays in pars """
+
+        method = 'solve_discrete' if discrete else 'solve_continous'
+        return sweep(self,pars,method,workers,chunksize)
+
     def solve_wF_vec(self,discrete=False):
         """ solve model for vector of female wages """
 
+        par = self.par
+        sol = self.sol
+
+        # a. solution vectors (wF_vec may have been changed after setup)
+        sol.LM_vec = np.zeros(par.wF_vec.size)
+        sol.HM_vec = np.zeros(par.wF_vec.size)
+        sol.LF_vec = np.zeros(par.wF_vec.size)
+        sol.HF_vec = np.zeros(par.wF_vec.size)
+
+        # b. discrete: all wages at once as a batch axis on the same grid
+        if discrete:
+
+            x = np.linspace(0,24,int(round(24/par.grid_step))+1)
+            sol.LM_vec[:],sol.HM_vec[:],sol.LF_vec[:],sol.HF_vec[:] = solve_grid_broadcast(self.utility_kernel(),x,par.chunk_size,wF=par.wF_vec)
+
+        # c. continuous: one optimization per wage
+        else:
 
-        pass
+            wF = par.wF
+            for i,wF_i in enumerate(par.wF_vec):
+                par.wF = wF_i
+                opt = self.solve_continous()
+                sol.LM_vec[i] = opt.LM
+                sol.HM_vec[i] = opt.HM
+                sol.LF_vec[i] = opt.LF
+                sol.HF_vec[i] = opt.HF
+            par.wF = wF
 
     def run_regression(self):
         """ run regression """
@@ -275,7 +636,86 @@ class HouseholdSpecializationModelClass2:
         A = np.vstack([np.ones(x.size),x]).T
         sol.beta0,sol.beta1 = np.linalg.lstsq(A,y,rcond=None)[0]
     
-    def estimate(self,alpha=None,sigma=None):
-        """ estimate alpha and sigma """
+    def calc_loss(self,alpha,sigma,discrete=False):
+        """ squared distance of the regression coefficients to the targets """
+
+        par = self.par
+        sol = self.sol
+
+        # a. key on rounded parameters and everything else that affects the solution,
+        # including the grid (discrete) and the solver settings (continuous)
+        alpha = round(alpha,par.cache_decimals)
+        sigma = round(sigma,par.cache_decimals)
+        key = (alpha,sigma,discrete,par.rho,par.nu,par.epsilon,par.omega,par.wM,tuple(par.wF_vec))
+        if discrete:
+            key += (par.grid_step,)
+        else:
+            key += (par.analytic_grad,par.ftol)
+
+        # b. look up or solve, par is set in both cases so it matches the returned loss
+        par.alpha = alpha
+        par.sigma = sigma
+        if key in sol.cache:
+            sol.cache.move_to_end(key)
+            sol.cache_hits += 1
+        else:
+            self.solve_wF_vec(discrete=discrete)
+            self.run_regression()
+            sol.cache[key] = (sol.LM_vec,sol.HM_vec,sol.LF_vec,sol.HF_vec,sol.beta0,sol.beta1)
+            if len(sol.cache) > par.cache_size:
+                sol.cache.popitem(last=False)
+
+        sol.LM_vec,sol.HM_vec,sol.LF_vec,sol.HF_vec,sol.beta0,sol.beta1 = sol.cache[key]
 
-        pass
+        return (sol.beta0-par.beta0_target)**2 + (sol.beta1-par.beta1_target)**2
+
+    def estimate(self,alpha=None,sigma=None,discrete=False,do_print=False):
+        """ estimate alpha and sigma
+
+        A parameter given as an argument is held fixed at that value,
+        otherwise it is estimated starting from its current value in par.
+        """
+
+        par = self.par
+        sol = self.sol
+        opt = SimpleNamespace()
+
+        # a. parameters to estimate
+        names = [name for name,value in [('alpha',alpha),('sigma',sigma)] if value is None]
+        fixed = {'alpha':alpha,'sigma':sigma}
+        bounds = {'alpha':(0.01,0.99),'sigma':(0.01,None)}
+
+        def obj(x):
+            sol.nfev += 1
+            pars = dict(fixed,**dict(zip(names,x)))
+            return self.calc_loss(pars['alpha'],pars['sigma'],discrete)
+
+        # b. inner continuous solves warm start from neighbouring parameters
+        warm_start = par.warm_start
+        par.warm_start = True
+        sol.nfev = 0
+        sol.cache_hits = 0
+
+        # c. minimize the loss
+        if len(names) > 0:
+            guess = [getattr(par,name) for name in names]
+            res = optimize.minimize(obj,guess,method='Nelder-Mead',bounds=[bounds[name] for name in names])
+            x = res.x
+        else:
+            x = []
+        opt.loss = obj(x)
+        par.warm_start = warm_start
+
+        # d. store results
+        opt.alpha = par.alpha
+        opt.sigma = par.sigma
+        opt.beta0 = sol.beta0
+        opt.beta1 = sol.beta1
+        opt.nfev = sol.nfev
+        opt.cache_hits = sol.cache_hits
+
+        if do_print:
+            for k,v in opt.__dict__.items():
+                print(f'{k} = {v:6.4f}')
+
+        return opt
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from types import SimpleNamespace
 from scipy import optimize
 import math
+import cournot_kernels
 
 class Firm1:
 
@@ -20,6 +21,8 @@ class Firm1:
         P: inverse demand
         q2: Output of firm 2
         a: itercept of the inverse demand (fixed parameter)
+        cost_power: the cost is c*q1**cost_power-K
+        use_kernel: use the closed form solution of the first order condition if it has been generated (see cournot_kernels)
         
         """
         #create namespaces to store values
@@ -31,6 +34,8 @@ class Firm1:
         par.c = 1
         par.q2 = 6 #Firm 2 produces this quantity no matter what
         par.P = 13 #fixed compnent in inverse demand
+        par.cost_power = 1 #linear cost
+        par.use_kernel = True
 
         self.q1 = np.nan
 
@@ -43,7 +48,7 @@ class Firm1:
         #total revenue
         rev_tot = (par.P-par.q2-q1)*q1
         #total cost
-        cost_tot = (par.c*q1)-par.K
+        cost_tot = (par.c*q1**par.cost_power)-par.K
         #total profit
         profit_tot = rev_tot-cost_tot
         
@@ -52,6 +57,7 @@ class Firm1:
     def solve_q1(self):
         """solve for the q1 that max the utility"""
 
+        par = self.par
         sol = self.sol
         
         def u(x):
@@ -59,10 +65,16 @@ class Firm1:
         
         #create bounds equal or larger than 0 because is impossible to produce negative quantities
         bounds = (0,13)
-        
-        sol = optimize.minimize_scalar(lambda q1: u(q1),bounds=bounds)
-        
-        self.q1 = sol.x
+
+        #closed form solution if it has been generated and it is within the bounds, otherwise optimize
+        kernel = cournot_kernels.kernel('firm1',par.cost_power) if par.use_kernel else None
+        q1 = kernel(P=par.P,c=par.c,K=par.K,q2=par.q2)[0] if kernel is not None else np.nan
+
+        if bounds[0] <= q1 <= bounds[1]:
+            self.q1 = q1
+        else:
+            sol = optimize.minimize_scalar(lambda q1: u(q1),bounds=bounds)
+            self.q1 = sol.x
         self.u = self.profit(self.q1)
 
         
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from types import SimpleNamespace
 from scipy import optimize
 import math
+import cournot_kernels
 
 class Nash_Eq:
 
@@ -21,6 +22,9 @@ class Nash_Eq:
         par.K = 12 #fixed cost
         par.c = 1  #marginal cost 
         par.P = 13 #fixed compnent in inverse demand
+        par.cost_power = 1 #the cost is c*q**cost_power-K
+        par.use_kernel = True #use the closed form solution of the first order conditions if it has been generated (see cournot_kernels)
+        par.tol = 1e-8 #tolerance of the best responses when there is no closed form solution
 
         self.q1 = np.nan
         self.q2 = np.nan
@@ -40,8 +44,8 @@ class Nash_Eq:
         rev_tot2 = (par.P-q2-q1)*q2
         
         #total cost
-        cost_tot1 = (par.c*q1)-par.K
-        cost_tot2 = (par.c*q2)-par.K
+        cost_tot1 = (par.c*q1**par.cost_power)-par.K
+        cost_tot2 = (par.c*q2**par.cost_power)-par.K
         
         #total profit
         profit_tot1 = rev_tot1-cost_tot1
@@ -57,6 +61,16 @@ class Nash_Eq:
         #get the sum of both profits
         return -(self.total_profit(q1,q2)[0]+self.total_profit(q1,q2)[1])
         
+    def best_response(self,q_other,firm):
+        """output that maximizes the profit of firm 1 or 2 given the output of the other firm"""
+
+        def objective(q):
+            return -self.total_profit(q,q_other)[0] if firm == 1 else -self.total_profit(q_other,q)[1]
+
+        sol = optimize.minimize_scalar(objective,bounds=(0,13),method='bounded',options={'xatol':self.par.tol})
+
+        return sol.x
+
     def solve_q1_q2(self):
 
         par = self.par
@@ -68,15 +82,26 @@ class Nash_Eq:
         #make a guess
         guess = [4,4]
 
-        #for the method 'L-BFGS-B' we need to indicate the max num of iterations and also we just want to show the values that's why the False in disp
-        options = {'maxiter': 100, 'disp': False}
+        #closed form solution of the first order conditions if it has been generated and it is within the bounds
+        kernel = cournot_kernels.kernel('nash',par.cost_power) if par.use_kernel else None
+        q1,q2 = kernel(P=par.P,c=par.c,K=par.K) if kernel is not None else (np.nan,np.nan)
+
+        if not (bounds[0][0] <= q1 <= bounds[0][1] and bounds[1][0] <= q2 <= bounds[1][1]):
 
-        sol = optimize.minimize(self.objective,guess,method='L-BFGS-B',bounds=bounds,options=options)
+            #otherwise iterate on the best responses of the firms until no firm wants to change its output
+            q1,q2 = guess
+            for it in range(100):
+                q1_new = self.best_response(q2,1)
+                q2_new = self.best_response(q1_new,2)
+                converged = abs(q1_new-q1) < par.tol and abs(q2_new-q2) < par.tol
+                q1,q2 = q1_new,q2_new
+                if converged:
+                    break
 
-        self.q1 = sol.x[0]
-        self.q2 = sol.x[1]
+        self.q1 = q1
+        self.q2 = q2
 
-        self.objective = -sol.fun #give the objective function the maximum value obtain by the optimize function
+        self.objective = sum(self.total_profit(self.q1,self.q2)) #give the objective function the sum of the profits in the equilibrium
 
         print(f'The optimal output for Fimr 1 is: {self.q1:.2f} units.')
         print(f'The optimal output for Fimr 2 is: {self.q2:.2f} units')
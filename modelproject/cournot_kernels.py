@@ -0,0 +1,178 @@
+import os
+import ast
+import json
+import functools
+import numpy as np
+
+# kernels shipped with the project, regenerated with `python cournot_kernels.py`
+KERNEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cournot_kernels.json')
+
+# kernels generated for other specifications are kept in the user's cache folder
+USER_KERNEL_FILE = os.environ.get('COURNOT_KERNEL_CACHE',os.path.join(os.path.expanduser('~'),'.cache','cournot_kernels.json'))
+
+# arguments and outputs of the kernel for each model
+MODELS = {
+    'firm1': (['P','c','K','q2'],['q1']), # Firm1: output of firm 1 given the output of firm 2
+    'nash': (['P','c','K'],['q1','q2']), # Nash_Eq: outputs in the Nash equilibrium
+    'merge': (['P','c1','K'],['Q']), # Merge: output of the merged firm
+}
+
+# cost powers where the first order conditions are linear and sympy solves them quickly
+DERIVABLE_POWERS = (1,2)
+
+def normalize_power(cost_power):
+    """1.0 and 1 are the same specification"""
+
+    return int(cost_power) if cost_power == int(cost_power) else float(cost_power)
+
+def spec_key(model,cost_power):
+    """Key of a model specification, the cost function is c*q**cost_power-K"""
+
+    return f'{model}:{normalize_power(cost_power)}'
+
+def derive(model,cost_power=1):
+    """Solve the first order conditions of a model symbolically
+
+    Returns the sympy expression of the solution for each output. Only the cost powers in
+    DERIVABLE_POWERS are derived, other specifications are solved numerically by the classes.
+    Requires sympy.
+    """
+
+    import sympy as sm
+
+    cost_power = normalize_power(cost_power)
+    if cost_power not in DERIVABLE_POWERS:
+        raise ValueError(f'cost_power {cost_power} has no closed form kernel, derivable powers are {DERIVABLE_POWERS}')
+
+    P,c,c1,K = sm.symbols('P c c1 K')
+    q1,q2,Q = sm.symbols('q1 q2 Q')
+
+    def profit(q,other,cost):
+        """revenue from the inverse demand P-Q minus the cost"""
+        return (P-q-other)*q-(cost*q**cost_power-K)
+
+    # a. first order conditions
+    if model == 'firm1':
+        focs,unknowns = [sm.diff(profit(q1,q2,c),q1)],[q1]
+    elif model == 'nash':
+        focs,unknowns = [sm.diff(profit(q1,q2,c),q1),sm.diff(profit(q2,q1,c),q2)],[q1,q2]
+    elif model == 'merge':
+        focs,unknowns = [sm.diff(profit(Q,0,c1),Q)],[Q]
+    else:
+        raise ValueError(f'unknown model {model}')
+
+    # b. solve, the conditions are linear so the solution is unique
+    sols = sm.solve(focs,unknowns,dict=True)
+
+    return [sols[0][unknown] for unknown in unknowns]
+
+def read(file):
+    """The kernels in a file, empty if there is none"""
+
+    if not os.path.exists(file):
+        return {}
+
+    with open(file) as f:
+        return json.load(f)
+
+# the only nodes allowed in a stored expression (sm.srepr of a rational function of the arguments)
+NODES = ('Add','Mul','Pow','Rational','Integer','Symbol')
+
+def parse_srepr(text,build,symbols):
+    """Rebuild an expression stored with sm.srepr from its syntax tree
+
+    Only calls of the nodes in NODES with numbers, and Symbol with a name in symbols, are accepted,
+    so nothing in a kernel file is evaluated as code. build maps each node to its constructor.
+    """
+
+    def visit(node):
+        if isinstance(node,ast.Constant) and type(node.value) is int:
+            return node.value
+        if isinstance(node,ast.UnaryOp) and isinstance(node.op,ast.USub) and isinstance(node.operand,ast.Constant) and type(node.operand.value) is int:
+            return -node.operand.value
+        if isinstance(node,ast.Call) and isinstance(node.func,ast.Name) and node.func.id in NODES and not node.keywords:
+            if node.func.id == 'Symbol':
+                if len(node.args) == 1 and isinstance(node.args[0],ast.Constant) and node.args[0].value in symbols:
+                    return build['Symbol'](node.args[0].value)
+            else:
+                return build[node.func.id](*[visit(arg) for arg in node.args])
+        raise ValueError(f'unexpected expression in kernel file: {ast.unparse(node)}')
+
+    return visit(ast.parse(text,mode='eval').body)
+
+# constructors of NumPy functions of a dict of arguments, used when sympy is not installed
+NUMPY_BUILD = {
+    'Add': lambda *terms: lambda x: sum(term(x) for term in terms),
+    'Mul': lambda *factors: lambda x: functools.reduce(lambda a,b: a*b,[factor(x) for factor in factors]),
+    'Pow': lambda base,exp: lambda x: base(x)**exp(x),
+    'Rational': lambda p,q: lambda x: p/q,
+    'Integer': lambda n: lambda x: n,
+    'Symbol': lambda name: lambda x: np.asarray(x[name],dtype=float),
+}
+
+def compile_kernel(model,exprs):
+    """Turn the stored solution into a vectorised NumPy function
+
+    With sympy the expressions are lambdified, otherwise they are evaluated node by node with NumPy.
+    """
+
+    args,outputs = MODELS[model]
+
+    try:
+        import sympy as sm
+    except ImportError:
+        funcs = [parse_srepr(expr,NUMPY_BUILD,args) for expr in exprs]
+        def kernel(*values,**named):
+            x = dict(zip(args,values),**named)
+            return [func(x) for func in funcs]
+    else:
+        build = {name:getattr(sm,name) for name in NODES}
+        kernel = sm.lambdify(sm.symbols(args),[parse_srepr(expr,build,args) for expr in exprs],'numpy')
+
+    kernel.__doc__ = f'{", ".join(outputs)} from the first order conditions of {model}'
+
+    return kernel
+
+@functools.lru_cache(maxsize=None)
+def kernel(model,cost_power=1):
+    """Vectorised closed form solution of a model, or None if it has not been generated
+
+    Looks in the kernels shipped with the project and in the user's cache, nothing is derived
+    here, see generate.
+    """
+
+    key = spec_key(model,cost_power)
+    for file in [KERNEL_FILE,USER_KERNEL_FILE]:
+        kernels = read(file)
+        if key in kernels:
+            return compile_kernel(model,kernels[key])
+
+    return None
+
+def generate(model,cost_power=1,file=None):
+    """Derive the kernel of a specification with sympy and save it, by default in the user's cache"""
+
+    import sympy as sm
+
+    file = USER_KERNEL_FILE if file is None else file
+    exprs = derive(model,cost_power)
+
+    kernels = read(file)
+    kernels[spec_key(model,cost_power)] = [sm.srepr(expr) for expr in exprs]
+
+    os.makedirs(os.path.dirname(os.path.abspath(file)),exist_ok=True)
+    with open(file,'w') as f:
+        json.dump(kernels,f,indent=1,sort_keys=True)
+
+    kernel.cache_clear()
+
+    return kernel(model,cost_power)
+
+if __name__ == '__main__':
+
+    # regenerate the kernels shipped with the project
+    if os.path.exists(KERNEL_FILE):
+        os.remove(KERNEL_FILE)
+    for model in MODELS:
+        for cost_power in DERIVABLE_POWERS:
+            generate(model,cost_power,file=KERNEL_FILE)
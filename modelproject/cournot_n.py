@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+from types import SimpleNamespace
+
+def solve_cournot(P,c,K=0.0,b=1.0):
+    """Nash equilibrium of Cournot competition with linear inverse demand P-b*Q
+
+    c are the marginal costs with the firms along the last axis, any leading axes are
+    independent markets solved at once. P, b and K broadcast against c (P and b per market).
+    The first order conditions P-b*Q-b*q_i-c_i = 0 give the price (P+sum of c_i)/(n+1)
+    for the n active firms. Firms are sorted by cost and the active ones are the
+    cheapest n with c_i below that price, so no iteration is needed.
+    """
+
+    c = np.asarray(c,dtype=float)
+    N = c.shape[-1]
+    P = np.broadcast_to(np.asarray(P,dtype=float),c.shape[:-1])
+    b = np.asarray(b,dtype=float)
+
+    #price if the n cheapest firms are active, for n = 1,...,N
+    c_sorted = np.sort(c,axis=-1)
+    n = np.arange(1,N+1)
+    price_n = (P[...,np.newaxis]+np.cumsum(c_sorted,axis=-1))/(n+1)
+
+    #the active firms are a prefix of the sorted firms
+    n_active = np.sum(c_sorted < price_n,axis=-1)
+    price = np.take_along_axis(price_n,np.maximum(n_active-1,0)[...,np.newaxis],axis=-1)[...,0]
+    price = np.where(n_active > 0,price,P) #no firm produces if all costs are above P
+
+    q = np.maximum((price[...,np.newaxis]-c)/b[...,np.newaxis],0)
+    profit = (price[...,np.newaxis]-c)*q-K
+
+    return q,price,profit
+
+class Nash_Eq_N:
+
+    def __init__(self):
+        """Cournot competition between N firms, possibly in many markets at once
+
+        c: Marginal costs (firms along the last axis, markets along the leading axes)
+        K: Fixed costs (broadcast against c)
+        P: fixed component in inverse demand (per market)
+        b: slope of the inverse demand (per market)
+        """
+
+        #create namespaces to store values
+        par = self.par = SimpleNamespace()
+        sol = self.sol = SimpleNamespace()
+
+        #create the variables that are fixed
+        par.P = 13
+        par.b = 1
+        par.c = np.array([1.0,1.0])
+        par.K = np.array([12.0,12.0])
+
+    def solve(self):
+        """solve for the Nash equilibrium outputs, price, profits and surplus"""
+
+        par = self.par
+        sol = self.sol
+
+        sol.q,sol.price,sol.profit = solve_cournot(par.P,par.c,par.K,par.b)
+        sol.Q = np.sum(sol.q,axis=-1)
+
+        #surplus for the firms and the consumers, at the end total surplus
+        sol.firms_s = (sol.price[...,np.newaxis]-par.c)*sol.q
+        sol.consumers = (par.P-sol.price)*sol.Q/2
+        sol.total_surplus = np.sum(sol.firms_s,axis=-1)+sol.consumers
+
+        return sol
+
+def market_scenarios(P=13,c1=2,c2=4,K=12,q2=None,grid=False):
+    """Duopoly and merged monopoly outcomes for many parameter sets at once
+
+    P, c1, c2 and K (and q2) are broadcast against each other, one scenario per element,
+    or combined into their Cartesian product if grid is True. The duopoly is the Nash
+    equilibrium of Nash_Eq with costs c1 and c2, the merged firm produces at the lowest
+    of the two marginal costs as in Merge. If q2 is given the output of Firm 1 when
+    Firm 2 produces q2, as in Firm1, is added. Fixed costs K are subtracted in the profits.
+    Returns a DataFrame with a row per scenario.
+    """
+
+    #a. scenarios
+    pars = {'P':P,'c1':c1,'c2':c2,'K':K}
+    if q2 is not None:
+        pars['q2'] = q2
+    values = [np.asarray(value,dtype=float) for value in pars.values()]
+    if grid:
+        values = np.meshgrid(*[value.ravel() for value in values],indexing='ij')
+    values = [value.ravel() for value in np.broadcast_arrays(*values)]
+    df = pd.DataFrame(dict(zip(pars.keys(),values)))
+    P,c1,c2,K = [df[name].values for name in ['P','c1','c2','K']]
+
+    #b. Firm 1 given the output of Firm 2
+    if q2 is not None:
+        df['q1_given_q2'] = np.maximum((P-df['q2'].values-c1)/2,0)
+
+    #c. duopoly
+    c = np.stack([c1,c2],axis=-1)
+    q,price,profit = solve_cournot(P,c,K[:,np.newaxis])
+    df['q1'] = q[:,0]
+    df['q2_duopoly'] = q[:,1]
+    df['price_duopoly'] = price
+    df['profit1'] = profit[:,0]
+    df['profit2'] = profit[:,1]
+    df['firm1_s'] = (price-c1)*q[:,0]
+    df['firm2_s'] = (price-c2)*q[:,1]
+    df['consumers_duopoly'] = (P-price)*(q[:,0]+q[:,1])/2
+    df['total_surplus_duopoly'] = df['firm1_s']+df['firm2_s']+df['consumers_duopoly']
+
+    #d. merged monopoly
+    c_merged = np.minimum(c1,c2)
+    Q = np.maximum((P-c_merged)/2,0)
+    price = P-Q
+    df['Q_merged'] = Q
+    df['price_merged'] = price
+    df['profit_merged'] = (price-c_merged)*Q-K
+    df['monopoly'] = (price-c_merged)*Q
+    df['consumers'] = (P-price)*Q/2
+    df['total_surplus'] = df['monopoly']+df['consumers']
+
+    #e. welfare change from the merger
+    df['delta_total_surplus'] = df['total_surplus']-df['total_surplus_duopoly']
+
+    return df
+
+def best_response(P,c,Q_other,b=1.0):
+    """output that maximizes the profit of a firm with marginal cost c given the output of the others"""
+
+    return np.maximum((P-c-b*Q_other)/(2*b),0)
+
+class Dynamic_Cournot:
+
+    def __init__(self):
+        """Cournot competition repeated over many periods where the firms adjust their output
+        towards the best response to the output of the other firms in the previous period,
+        for many markets at once
+
+        c: Marginal costs (markets,firms), or (firms,) for the same costs in all markets
+        P: fixed component in inverse demand (per market)
+        b: slope of the inverse demand
+        sigma: standard deviation of the shocks to P in each period
+        mode: 'simultaneous' (all firms respond at once), 'sequential' (one firm at a time,
+              seeing the outputs already chosen in the period) or 'partial' (all firms at once
+              but only a share speed of the way to the best response)
+        T: number of periods
+        tol: a market has converged when all outputs are within tol of the Nash equilibrium
+        """
+
+        #create namespaces to store values
+        par = self.par = SimpleNamespace()
+        sol = self.sol = SimpleNamespace()
+
+        #create the variables that are fixed
+        par.P = 13
+        par.b = 1
+        par.c = np.array([1.0,1.0])
+        par.q0 = 0.0 #initial outputs
+        par.sigma = 0.0
+        par.mode = 'simultaneous'
+        par.speed = 0.5
+        par.T = 100
+        par.tol = 1e-6
+
+    def simulate(self,rng=None,record=True):
+        """simulate the outputs of all firms in all markets
+
+        rng: seed or Generator for the demand shocks
+        record: keep the outputs in every period in sol.q_path with shape (T+1,markets,firms),
+                in memory if True, in a memory-mapped .npy file if a filename, not at all if False
+        """
+
+        par = self.par
+        sol = self.sol
+
+        # a. markets and firms
+        P = np.asarray(par.P,dtype=float)
+        c = np.asarray(par.c,dtype=float)
+        M = np.broadcast(P,c[...,0]).shape
+        M = M[0] if len(M) > 0 else 1
+        N = c.shape[-1]
+        P = np.broadcast_to(P,(M,))
+        c = np.broadcast_to(c,(M,N))
+
+        rng = np.random.default_rng(rng)
+
+        # b. buffers
+        if record is True:
+            sol.q_path = np.empty((par.T+1,M,N))
+        elif record:
+            sol.q_path = np.lib.format.open_memmap(record,mode='w+',dtype=float,shape=(par.T+1,M,N))
+        else:
+            sol.q_path = None
+
+        q = np.empty((M,N))
+        q[:] = par.q0
+        br = np.empty((M,N))
+        sol.P_path = np.empty((par.T+1,M))
+        sol.dist = np.empty((par.T+1,M)) #largest distance to the Nash equilibrium
+
+        q_ast = solve_cournot(P,c,0,par.b)[0]
+        P_t = P
+        sol.P_path[0] = P
+        sol.dist[0] = np.max(np.abs(q-q_ast),axis=1)
+        if sol.q_path is not None:
+            sol.q_path[0] = q
+
+        # c. time loop
+        for t in range(1,par.T+1):
+
+            # i. demand
+            if par.sigma > 0:
+                P_t = P+par.sigma*rng.standard_normal(M)
+                q_ast = solve_cournot(P_t,c,0,par.b)[0]
+
+            # ii. adjustment
+            Q = np.sum(q,axis=1,keepdims=True)
+            if par.mode == 'simultaneous':
+                q[:] = best_response(P_t[:,np.newaxis],c,Q-q,par.b)
+            elif par.mode == 'partial':
+                br[:] = best_response(P_t[:,np.newaxis],c,Q-q,par.b)
+                q += par.speed*(br-q)
+            elif par.mode == 'sequential':
+                Q = Q[:,0]
+                for i in range(N):
+                    q_i = best_response(P_t,c[:,i],Q-q[:,i],par.b)
+                    Q += q_i-q[:,i]
+                    q[:,i] = q_i
+            else:
+                raise ValueError(f'unknown mode {par.mode}')
+
+            # iii. record
+            sol.P_path[t] = P_t
+            sol.dist[t] = np.max(np.abs(q-q_ast),axis=1)
+            if sol.q_path is not None:
+                sol.q_path[t] = q
+
+        if isinstance(sol.q_path,np.memmap):
+            sol.q_path.flush()
+
+        # d. convergence
+        sol.q = q
+        sol.converged = sol.dist[-1] < par.tol
+        below = sol.dist < par.tol
+        sol.periods = np.where(below.any(axis=0),np.argmax(below,axis=0),-1) #first period within tol, -1 if never
+        sol.convergence_rate = np.mean(sol.converged)
+        sol.mean_periods = np.mean(sol.periods[sol.converged]) if sol.converged.any() else np.nan
+
+        return sol
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from types import SimpleNamespace
 from scipy import optimize
 import math
+import cournot_kernels
 
 class Merge:
 
@@ -23,6 +24,8 @@ class Merge:
         par.c2 = 4 #marginal cost firm 2
 
         par.P = 13 #fixed compnent in inverse demand
+        par.cost_power = 1 #the cost is c1*Q**cost_power-K
+        par.use_kernel = True #use the closed form solution of the first order condition if it has been generated (see cournot_kernels)
 
         self.q1 = np.nan
         self.q2 = np.nan
@@ -40,12 +43,13 @@ class Merge:
         par = self.par
 
         rev = (par.P-Q)*Q
-        cost = (par.c1*Q)-par.K #we suppose that the new cost is based on the most efficient firm
+        cost = (par.c1*Q**par.cost_power)-par.K #we suppose that the new cost is based on the most efficient firm
         profit = rev-cost
         return profit
         
     def solve_Q(self):
         """Function that solves for the otimal quantity of the new monopoly"""
+        par = self.par
         sol = self.sol
         
         def objective(x):
@@ -55,9 +59,15 @@ class Merge:
 
         guess = 6
 
-        sol = optimize.minimize_scalar(objective,guess,bounds=bounds,method='bounded')
-            
-        self.Q = sol.x
+        #closed form solution if it has been generated and it is within the bounds, otherwise optimize
+        kernel = cournot_kernels.kernel('merge',par.cost_power) if par.use_kernel else None
+        Q = kernel(P=par.P,c1=par.c1,K=par.K)[0] if kernel is not None else np.nan
+
+        if bounds[0] <= Q <= bounds[1]:
+            self.Q = Q
+        else:
+            sol = optimize.minimize_scalar(objective,guess,bounds=bounds,method='bounded')
+            self.Q = sol.x
 
         self.objective = self.unique_profit(Q=self.Q)
 